@@ -5,11 +5,13 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from bson import ObjectId
+from pymongo import AsyncMongoClient, UpdateOne
+from pymongo.write_concern import WriteConcern
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
-from typing import Union
+from typing import List, Optional, Union
 from pydantic import BaseModel
 
 # Load environment variables from .env file
@@ -22,12 +24,22 @@ database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    # Pool sized for a single uvicorn worker; override through the environment
+    _client = AsyncMongoClient(
+        database_url,
+        maxPoolSize=int(os.getenv("DATABASE_MAX_POOL_SIZE", 40)),
+        minPoolSize=int(os.getenv("DATABASE_MIN_POOL_SIZE", 5)),
+        maxIdleTimeMS=30000,
+        serverSelectionTimeoutMS=2000,
+        socketTimeoutMS=5000,
+        connectTimeoutMS=3000,
+        retryWrites=True,
+    )
     db = _client[database_name]
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
-    """Insert a single document with timestamp"""
+async def create_document(collection_name: str, data: Union[BaseModel, dict], write_concern: Optional[WriteConcern] = None):
+    """Insert a single document with timestamp, optionally overriding the write concern"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
 
@@ -39,17 +51,37 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
 
     data_dict['created_at'] = datetime.now(timezone.utc)
     data_dict['updated_at'] = datetime.now(timezone.utc)
+    data_dict.setdefault('_id', ObjectId())
 
-    result = db[collection_name].insert_one(data_dict)
-    return str(result.inserted_id)
+    collection = db[collection_name]
+    if write_concern is not None:
+        collection = collection.with_options(write_concern=write_concern)
+    await collection.insert_one(data_dict)
+    return str(data_dict['_id'])
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
+async def upsert_documents(collection_name: str, items: List[Union[BaseModel, dict]], key_field: str):
+    """Insert documents whose key_field value is not present yet, leaving existing ones untouched"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    now = datetime.now(timezone.utc)
+    ops = []
+    for data in items:
+        data_dict = data.model_dump() if isinstance(data, BaseModel) else data.copy()
+        data_dict['created_at'] = now
+        data_dict['updated_at'] = now
+        ops.append(UpdateOne({key_field: data_dict[key_field]}, {"$setOnInsert": data_dict}, upsert=True))
+
+    result = await db[collection_name].bulk_write(ops, ordered=False)
+    return result.upserted_count
+
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None, projection: dict = None):
     """Get documents from collection"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
-    cursor = db[collection_name].find(filter_dict or {})
+    cursor = db[collection_name].find(filter_dict or {}, projection)
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    return await cursor.to_list(length=None)
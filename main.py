@@ -1,13 +1,24 @@
+import asyncio
+import hashlib
+import logging
 import os
-from fastapi import FastAPI, HTTPException
+import time
+from dataclasses import dataclass
+import orjson
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from pymongo.errors import OperationFailure
+from pymongo.write_concern import WriteConcern
+from typing import Dict, List, Optional, Tuple
 
-from database import db, create_document, get_documents
+from database import db, create_document, get_documents, upsert_documents
 from schemas import Service, QuoteRequest
 
-app = FastAPI(title="Print Studio API", version="1.0.0")
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="Print Studio API", version="1.0.0", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,46 +28,128 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Quotes are estimates, so a primary-only ack is enough; QUOTE_WRITE_W="majority" restores the stricter default
+_quote_w = os.getenv("QUOTE_WRITE_W", "1")
+QUOTE_WRITE_CONCERN = WriteConcern(w=int(_quote_w) if _quote_w.isdigit() else _quote_w, j=False)
+
+@dataclass(slots=True, frozen=True)
+class _ServiceCached:
+    """Compact copy of the Service fields needed for pricing"""
+    key: str
+    name: str
+    base_price: float
+    color_price_per_color: float
+    print_area_multiplier: float
+    minimum_quantity: int
+
+    @classmethod
+    def from_service(cls, s: Service) -> "_ServiceCached":
+        return cls(s.key, s.name, s.base_price, s.color_price_per_color, s.print_area_multiplier, s.minimum_quantity)
+
+# In-process cache of service documents, keyed by service key
+SERVICE_CACHE_TTL = 60.0
+_service_cache: Dict[str, Tuple[float, _ServiceCached]] = {}
+_services_loaded_at: Optional[float] = None
+# Pre-serialized body of /services, with its ETag
+_services_json: bytes = b"[]"
+_services_etag: Optional[str] = None
+
+async def load_services() -> None:
+    """Load every service from the database and repopulate the cache"""
+    global _services_loaded_at, _services_json, _services_etag
+    docs = await get_documents("service", projection={"_id": 0})
+    services = [Service.model_validate(d) for d in docs]
+    now = time.monotonic()
+    _service_cache.clear()
+    for s in services:
+        _service_cache[s.key] = (now, _ServiceCached.from_service(s))
+    _services_json = orjson.dumps([s.model_dump(mode="json") for s in services])
+    _services_etag = '"%s"' % hashlib.blake2b(_services_json, digest_size=16).hexdigest()
+    _services_loaded_at = now
+
+async def get_service(key: str) -> Optional[_ServiceCached]:
+    """Return a service by key, reloading it from the database once the cached copy expires"""
+    entry = _service_cache.get(key)
+    if entry is not None and time.monotonic() - entry[0] < SERVICE_CACHE_TTL:
+        return entry[1]
+    svc_doc = await db["service"].find_one({"key": key}, {"_id": 0})
+    if not svc_doc:
+        _service_cache.pop(key, None)
+        return None
+    service = _ServiceCached.from_service(Service.model_validate(svc_doc))
+    _service_cache[key] = (time.monotonic(), service)
+    return service
+
+# Startup hooks are best-effort: an unreachable database must not stop the app from booting.
+# The service cache reloads lazily on the first request that needs it.
+@app.on_event("startup")
+async def warm_database_pool():
+    # Open a pooled connection up front so the first request skips the handshake
+    if db is None:
+        return
+    try:
+        await db.command("ping")
+    except Exception as e:
+        logger.warning("Database warm-up ping failed: %s", e)
+
+@app.on_event("startup")
+async def ensure_indexes():
+    # create_index is a no-op when a matching index already exists
+    if db is None:
+        return
+    try:
+        await db["service"].create_index("key", unique=True)
+    except OperationFailure as e:
+        # Raised as DuplicateKeyError when older data already holds repeated service keys
+        logger.error("Could not create unique index on service.key; remove duplicate services: %s", e)
+    except Exception as e:
+        logger.warning("Index creation failed: %s", e)
+    try:
+        await db["quoterequest"].create_index([("customer_email", 1), ("service_key", 1)])
+    except Exception as e:
+        logger.warning("Index creation failed: %s", e)
+
+@app.on_event("startup")
+async def prime_service_cache():
+    if db is None:
+        return
+    try:
+        await load_services()
+    except Exception as e:
+        logger.warning("Priming the service cache failed: %s", e)
+
 @app.get("/")
 def read_root():
     return {"message": "Print Studio Backend Ready"}
 
+# Health fields that don't change while the process runs
+_HEALTH_STATIC = {
+    "backend": "✅ Running",
+    "database": "✅ Available" if db is not None else "⚠️  Available but not initialized",
+    "database_url": ("✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set") if db is not None else None,
+    "database_name": db.name if db is not None else None,
+    "connection_status": "Connected" if db is not None else "Not Connected",
+    "collections": [],
+}
+
 @app.get("/test")
-def test_database():
-    response = {
-        "backend": "✅ Running",
-        "database": "❌ Not Available",
-        "database_url": None,
-        "database_name": None,
-        "connection_status": "Not Connected",
-        "collections": []
-    }
+async def test_database():
+    response = _HEALTH_STATIC.copy()
+    response["collections"] = []
+    if db is None:
+        return response
     try:
-        if db is not None:
-            response["database"] = "✅ Available"
-            response["database_url"] = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
-            response["database_name"] = getattr(db, 'name', None) or "✅ Connected"
-            response["connection_status"] = "Connected"
-            try:
-                collections = db.list_collection_names()
-                response["collections"] = collections[:10]
-                response["database"] = "✅ Connected & Working"
-            except Exception as e:
-                response["database"] = f"⚠️  Connected but Error: {str(e)[:80]}"
-        else:
-            response["database"] = "⚠️  Available but not initialized"
+        await asyncio.wait_for(db.command("ping"), timeout=0.5)
+        response["database"] = "✅ Connected & Working"
     except Exception as e:
-        response["database"] = f"❌ Error: {str(e)[:80]}"
+        response["database"] = f"⚠️  Connected but Error: {str(e)[:80] or type(e).__name__}"
     return response
 
-# Seed some default services if collection empty
+# Seed the default services; safe to re-run, existing keys are left untouched
 @app.post("/seed/services")
-def seed_services():
+async def seed_services():
     if db is None:
         raise HTTPException(status_code=500, detail="Database not configured")
-    existing = db["service"].count_documents({})
-    if existing > 0:
-        return {"seeded": False, "message": "Services already exist"}
 
     defaults: List[Service] = [
         Service(
@@ -91,10 +184,10 @@ def seed_services():
         ),
     ]
 
-    for s in defaults:
-        create_document("service", s)
+    inserted = await upsert_documents("service", defaults, "key")
+    await load_services()
 
-    return {"seeded": True, "count": len(defaults)}
+    return {"seeded": True, "inserted": inserted}
 
 # Pricing logic
 class PriceRequest(BaseModel):
@@ -108,69 +201,98 @@ class PriceResponse(BaseModel):
     total_price: float
     breakdown: dict
 
+def _etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """Weak If-None-Match comparison (RFC 9110): W/ prefixes are ignored on both sides"""
+    if not if_none_match or etag is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for token in if_none_match.split(","):
+        token = token.strip()
+        if token.startswith("W/"):
+            token = token[2:]
+        if token == opaque:
+            return True
+    return False
+
 @app.get("/services", response_model=List[Service])
-def list_services():
-    docs = get_documents("service")
-    return [Service(**{k: v for k, v in d.items() if k != "_id"}) for d in docs]
+async def list_services(request: Request):
+    if _services_loaded_at is None or time.monotonic() - _services_loaded_at >= SERVICE_CACHE_TTL:
+        await load_services()
 
-@app.post("/price", response_model=PriceResponse)
-def calculate_price(req: PriceRequest):
-    if db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
+    headers = {"Cache-Control": f"public, max-age={int(SERVICE_CACHE_TTL)}", "ETag": _services_etag}
+    if _etag_matches(request.headers.get("if-none-match"), _services_etag):
+        return Response(status_code=304, headers=headers)
 
-    svc_doc = db["service"].find_one({"key": req.service_key})
-    if not svc_doc:
-        raise HTTPException(status_code=404, detail="Service not found")
-    service = Service(**{k: v for k, v in svc_doc.items() if k != "_id"})
+    return Response(content=_services_json, media_type="application/json", headers=headers)
+
+# Fixed print area multipliers; "large" uses the service's own multiplier
+_AREA_FIXED = {"small": 0.9, "medium": 1.0}
+# (minimum quantity, unit price factor), largest bracket first
+_VOLUME_BRACKETS = ((100, 0.75), (50, 0.82), (20, 0.9))
 
-    area_multiplier_map = {"small": 0.9, "medium": 1.0, "large": service.print_area_multiplier}
-    area_mult = area_multiplier_map.get(req.print_area, 1.0)
+def _compute_price(service: _ServiceCached, quantity: int, colors: int, print_area: str) -> PriceResponse:
+    """Price an order for an already-loaded service; callers validate the minimum quantity"""
+    if print_area == "large":
+        area_mult = service.print_area_multiplier
+    else:
+        area_mult = _AREA_FIXED.get(print_area, 1.0)
 
     unit = service.base_price
-    color_add = max(0, req.colors - 1) * service.color_price_per_color
+    color_add = max(0, colors - 1) * service.color_price_per_color
     unit_price = round((unit + color_add) * area_mult, 2)
 
     # volume discount for low price positioning
-    if req.quantity >= 100:
-        unit_price *= 0.75
-    elif req.quantity >= 50:
-        unit_price *= 0.82
-    elif req.quantity >= 20:
-        unit_price *= 0.9
+    for threshold, factor in _VOLUME_BRACKETS:
+        if quantity >= threshold:
+            unit_price *= factor
+            break
     unit_price = round(unit_price, 2)
 
-    if req.quantity < service.minimum_quantity:
-        raise HTTPException(status_code=400, detail=f"Minimum quantity is {service.minimum_quantity}")
-
-    total_price = round(unit_price * req.quantity, 2)
+    total_price = round(unit_price * quantity, 2)
 
     return PriceResponse(
         unit_price=unit_price,
         total_price=total_price,
         breakdown={
             "base": service.base_price,
-            "colors": req.colors,
+            "colors": colors,
             "color_add_per_unit": service.color_price_per_color,
             "area_multiplier": area_mult,
             "volume_discounts": True,
         },
     )
 
+@app.post("/price", response_model=PriceResponse)
+async def calculate_price(req: PriceRequest):
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database not configured")
+
+    service = await get_service(req.service_key)
+    if service is None:
+        raise HTTPException(status_code=404, detail="Service not found")
+    if req.quantity < service.minimum_quantity:
+        raise HTTPException(status_code=400, detail=f"Minimum quantity is {service.minimum_quantity}")
+
+    return _compute_price(service, req.quantity, req.colors, req.print_area)
+
 @app.post("/quotes")
-def create_quote(q: QuoteRequest):
+async def create_quote(q: QuoteRequest):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not configured")
 
+    service = await get_service(q.service_key)
+    if service is None:
+        raise HTTPException(status_code=404, detail="Service not found")
+    if q.quantity < service.minimum_quantity:
+        raise HTTPException(status_code=400, detail=f"Minimum quantity is {service.minimum_quantity}")
+
     # Calculate estimated price and store with quote
-    price = calculate_price(PriceRequest(
-        service_key=q.service_key,
-        quantity=q.quantity,
-        colors=q.colors,
-        print_area=q.print_area,
-    ))
+    price = _compute_price(service, q.quantity, q.colors, q.print_area)
 
     q.estimated_total = price.total_price
-    doc_id = create_document("quoterequest", q)
+    doc_id = await create_document("quoterequest", q.model_dump(exclude_none=True), write_concern=QUOTE_WRITE_CONCERN)
     return {"id": doc_id, "estimated_total": price.total_price}
 
 if __name__ == "__main__":
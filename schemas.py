@@ -37,6 +37,14 @@ class QuoteRequest(BaseModel):
     notes: Optional[str] = None
     estimated_total: Optional[float] = Field(None, ge=0)
 
+# Validate one payload at import so the first request doesn't pay for email validation setup
+QuoteRequest.model_validate({
+    "customer_name": "Warmup",
+    "customer_email": "warmup@example.com",
+    "service_key": "tshirt",
+    "quantity": 1,
+})
+
 # Orders (optional for this MVP)
 class Order(BaseModel):
     quote_id: Optional[str] = Field(None, description="Associated quote document id")